@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Compare the order in which people try to book: a random shuffle versus the PriorityScheduler.
+
+This runs against a fake reservation site held in memory, so no browser is needed.  Each week, a release window opens
+with a fixed number of slots.  On every tick, the public books some of the remaining slots, then our bots book one after
+another, as try_reservation does.  The public may also grab a slot between a bot looking at the site and submitting the
+form, in which case the whole submission fails, just as the real form does.
+"""
+
+import random
+import datetime
+from person import Person
+from priority_scheduler import PriorityScheduler
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+TIMES = ['11:30am', '2:30pm', '5:30pm']
+
+def format_date(date):
+  """
+  Format a date the way the reservation site does, e.g. 'July 10'.
+  :param date: The date to format.
+  :returns: The formatted date.
+  """
+  return '{} {}'.format(date.strftime('%B'), date.day)
+
+class FakeSite():
+
+  def __init__(self, week_start, seed, times=TIMES):
+    """
+    Release a week's worth of slots, one booking per slot.
+    :param week_start: The first date of the week.
+    :param seed: The random seed that decides what the public books.
+    :param times: The times available each day.
+    """
+    self.seed = seed
+    self.slots = {}
+    for i in range(7):
+      date = week_start + datetime.timedelta(days=i)
+      self.slots[format_date(date)] = {
+        'day': DAYS[date.weekday()],
+        'times': list(times)
+      }
+
+  def get_available_dates(self):
+    """
+    Take a snapshot of the slots still available.
+    :returns: A list of dates, each a dictionary with 'date', 'day', and 'times' fields, as the bot scrapes them.
+    """
+    return [{'date': date, 'day': s['day'], 'times': list(s['times'])} for date, s in self.slots.items() if len(s['times']) > 0]
+
+  def public_books(self, fraction, stage):
+    """
+    Let the public book some of the remaining slots.
+    Each slot's draw depends only on the seed, the stage, and the slot, so every strategy sees the same public, whatever our bots have booked.
+    :param fraction: The chance that any given slot is booked.
+    :param stage: Which point in the release window this is, e.g. (tick, position in the order).
+    """
+    for date, s in self.slots.items():
+      s['times'] = [t for t in s['times'] if random.Random('{}-{}-{}-{}'.format(self.seed, stage, date, t)).random() >= fraction]
+
+  def book(self, dates):
+    """
+    Submit a reservation for one time on each of several dates.  Fails entirely if any of the slots is gone.
+    :param dates: A list of (date, time) tuples.
+    :returns: True if the reservation was made, False otherwise.
+    """
+    if any([time not in self.slots[date]['times'] for date, time in dates]):
+      return False
+    for date, time in dates:
+      self.slots[date]['times'].remove(time)
+    return True
+
+class FakeBot():
+
+  def __init__(self, person, site, reservations, stage, max_per_week=3, race=0.1):
+    """
+    Book the way ReservationBot does.
+    :param person: The person for whom to make a reservation.
+    :param site: The fake site on which to book.
+    :param stage: Which point in the release window this is, for the public's draws.
+    :param reservations: The list of all reservations, to which to add any new ones.
+    :param max_per_week: The maximum number of reservations allowed per week.
+    :param race: The chance that the public books any given slot while the bot is filling in the form.
+    """
+    self.bookings = 0
+    snapshot = site.get_available_dates()
+    mine = [r for r in reservations if r['person'] is person and r['date'] in site.slots] # this week's reservations
+    reserved_dates = [r['date'] for r in mine]
+
+    # only dates not yet reserved, and not excluded by the person
+    dates = [d for d in snapshot if d['date'] not in reserved_dates and person.preferences.get(d['day']) != '-']
+    self.acceptable_slots = sum([len(d['times']) for d in dates])
+
+    # one time per day, and no more than the weekly limit
+    chosen = [(d['date'], d['times'][0]) for d in dates][:max(max_per_week - len(mine), 0)]
+
+    site.public_books(race, stage)
+    if len(chosen) > 0 and site.book(chosen):
+      self.bookings = len(chosen)
+      reservations += [{'person': person, 'date': date, 'time': time, 'type': 'benchmark'} for date, time in chosen]
+
+class FakePriorityScheduler(PriorityScheduler):
+
+  def __init__(self, reservations, **kwargs):
+    """
+    A PriorityScheduler that keeps its state and reservations in memory.
+    :param reservations: The list of all reservations.
+    """
+    super().__init__(filename=None, weeks=1, reservations=reservations, **kwargs) # the fake site only releases one week at a time
+
+  def load(self):
+    """
+    Start with no state, rather than loading it from file.
+    """
+    self.state = {}
+
+  def save(self):
+    """
+    Keep the state in memory only, rather than saving it to file.
+    """
+    pass
+
+  def get_reservations(self, person):
+    """
+    Get the reservations made so far for a specific person.
+    :param person: The person for whom to check the reservations.
+    :returns: A list of reservations, where each item is a dictionary with reservation 'person', 'date', 'time', and 'type' fields.
+    """
+    return [r for r in self.reservations if r['person'] is person]
+
+def make_people(count, seed):
+  """
+  Make a mix of people with flexible and narrow preferences.
+  :param count: The number of people.
+  :param seed: The random seed.
+  :returns: A list of people.
+  """
+  rng = random.Random(seed)
+  people = []
+  for i in range(count):
+    # about a third of people can only make one or two days a week
+    allowed = DAYS if rng.random() > 0.33 else rng.sample(DAYS, rng.randint(1, 2))
+    preferences = {day: '-' for day in DAYS if day not in allowed}
+    people.append(Person('Person', str(i), '', '', ['benchmark'], preferences))
+  return people
+
+def run(strategy, people, weeks=8, ticks=3, public=0.2, seed=0):
+  """
+  Simulate several weekly release windows.
+  :param strategy: Either 'shuffle' or 'priority'.
+  :param people: The people competing for slots.
+  :param weeks: The number of release windows.
+  :param ticks: The number of booking attempts per release window.
+  :param public: The chance that the public books any given slot before each tick.
+  :param seed: The random seed.
+  :returns: A list of the number of bookings made in each release window.
+  """
+  random.seed(seed)
+  reservations = []
+  scheduler = FakePriorityScheduler(reservations)
+
+  # start on the first Friday in March of this year, since the site's dates have no year
+  week_start = datetime.date(datetime.date.today().year, 3, 1)
+  week_start += datetime.timedelta(days=(4 - week_start.weekday()) % 7)
+
+  totals = []
+  for week in range(weeks):
+    site = FakeSite(week_start, '{}-{}'.format(seed, week))
+    before = len(reservations)
+    for tick in range(ticks):
+      site.public_books(public, tick)
+
+      # decide who goes first
+      if strategy == 'shuffle':
+        order = list(people)
+        random.shuffle(order)
+      else:
+        order = scheduler.order(people, today=week_start)
+
+      # book in order
+      for position, person in enumerate(order):
+        bot = FakeBot(person, site, reservations, (tick, position))
+        if strategy == 'priority':
+          scheduler.record(person, bot)
+
+    totals.append(len(reservations) - before)
+    week_start += datetime.timedelta(days=7)
+
+  return totals
+
+if __name__ == '__main__':
+  # try several mixes of people, since a single mix says little about whether one strategy is really better
+  slots = 7 * len(TIMES)
+  for mix in range(1, 6):
+    people = make_people(6, seed=mix)
+    print('Mix {}: {} people, {} slots per release window'.format(mix, len(people), slots))
+    for strategy in ['shuffle', 'priority']:
+      results = [run(strategy, people, seed=seed) for seed in range(50)]
+      per_window = [total for totals in results for total in totals]
+      print('  {:>8}: {:.2f} bookings per release window on average (min {}, max {})'.format(
+        strategy,
+        sum(per_window) / len(per_window),
+        min(per_window),
+        max(per_window)
+      ))
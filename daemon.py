@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Run the Silver Lake Reservation Bot as a long-lived daemon, controlled through a local HTTP API.
+
+Unlike main.py, which starts from scratch on every tick, the daemon keeps its browser, a bot for each person, the
+reservations on file, who goes first, and the most recently scraped availability in memory between ticks.  People can be
+added and removed while it runs.
+
+  GET    /status                     everything below, plus whether a scan is running
+  GET    /people                     the people for whom to make reservations
+  POST   /people                     add a person, e.g. {"first_name": "Katya", "last_name": "Bloomberg", "phone": "9148179962", "email": "katya@plasticpast.com", "preferences": {"Tuesday": "-"}}
+  DELETE /people/<first>/<last>      remove a person
+  POST   /scan                       scan for reservations right away
+  GET    /stats                      how long scans and booking flows have taken
+
+For example:
+
+  curl -X POST localhost:8020/scan
+"""
+
+import os
+import copy
+import json
+import time
+import queue
+import logging
+import threading
+import statistics
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from person import Person
+from reservation_bot import start_logging, load_reservations, get_person_key
+from tabbed_reservation_bot import TabScheduler
+from priority_scheduler import PriorityScheduler
+
+class ReservationDaemon():
+
+  def __init__(self, filename='people.json', interval=60, max_tabs=4, max_per_week=3, hidden=True, history_length=100):
+    """
+    Set up the daemon and load the people for whom to make reservations.
+    :param filename: The file in which to save the people for whom to make reservations.
+    :param interval: The number of seconds between scheduled scans.
+    :param max_tabs: The maximum number of booking flows to run at once.
+    :param max_per_week: The maximum number of reservations allowed per week.  Defaults to 3.
+    :param hidden: Whether to show the web browser or keep it hidden.
+    :param history_length: The number of recent latencies to keep for the stats.
+    """
+    start_logging('logs/log.txt')
+    self.logger = logging.getLogger('status')
+
+    self.filename = filename
+    self.interval = interval
+    self.history_length = history_length
+
+    # warm state, kept between scans
+    self.reservations = load_reservations()
+    self.tabs = TabScheduler(max_tabs=max_tabs, max_per_week=max_per_week, hidden=hidden, reservations=self.reservations)
+    self.priorities = PriorityScheduler(max_per_week=max_per_week, reservations=self.reservations)
+
+    self.people = {} # the people for whom to make reservations, by name
+    self.bots = {} # the bot that books for each person, by name
+    self.people_lock = threading.Lock() # held while people, and their bots, are added or removed
+    self.load_people()
+    self.availability = {} # the most recently scraped date/times for each appointment type
+    self.last_scan = None # when the most recent scan finished
+    self.state_lock = threading.Lock() # held while the priorities, availability, or latencies change, or are read by the API
+
+    # bookings run one at a time as tasks on a queue
+    self.tasks = queue.Queue()
+    self.scanning = False
+    self.scan_seconds = [] # how long recent scans took
+    self.flow_seconds = [] # how long recent booking flows took
+    self.running = False
+
+  def load_people(self):
+    """
+    Load the people for whom to make reservations from file, if any.
+    """
+    if not os.path.exists(self.filename):
+      return
+    with open(self.filename, 'r') as f:
+      for data in json.load(f):
+        try:
+          self.keep_person(self.make_person(data))
+        except (ValueError, KeyError) as e:
+          self.logger.info('Daemon: skipping invalid person in {}: {}'.format(self.filename, repr(e)))
+
+  def save_people(self):
+    """
+    Save the people for whom to make reservations to file, so they are still there after a restart.
+    """
+    with open(self.filename, 'w') as f:
+      json.dump([self.describe_person(person) for person in self.people.values()], f, indent=2)
+
+  def make_person(self, data):
+    """
+    Make a person from a dictionary, as sent to the API.
+    :param data: A dictionary with 'first_name', 'last_name', 'phone', 'email', and optionally 'appointment_types' and 'preferences' fields.
+    :returns: The person.
+    """
+    self.validate_person(data)
+
+    # leave out anything not given, so the person gets the defaults
+    options = {key: data[key] for key in ['appointment_types', 'preferences'] if key in data}
+    return Person(data['first_name'], data['last_name'], data['phone'], data['email'], **options)
+
+  def validate_person(self, data):
+    """
+    Make sure a person sent to the API can be booked for, and saved to the comma-separated reservations file.
+    :param data: A dictionary describing the person.
+    """
+    if not isinstance(data, dict):
+      raise ValueError('A person must be an object.')
+
+    # every value we use must be text
+    values = []
+    for field in ['first_name', 'last_name', 'phone', 'email']:
+      if not isinstance(data[field], str):
+        raise ValueError('{} must be a string.'.format(field))
+      values.append(data[field])
+    if 'appointment_types' in data:
+      if not isinstance(data['appointment_types'], list) or not all([isinstance(t, str) for t in data['appointment_types']]):
+        raise ValueError('appointment_types must be a list of strings.')
+      values += data['appointment_types']
+    if 'preferences' in data:
+      if not isinstance(data['preferences'], dict) or not all([isinstance(t, str) for t in data['preferences'].values()]):
+        raise ValueError('preferences must map days to strings.')
+      values += list(data['preferences'].keys()) + list(data['preferences'].values())
+
+    # commas and newlines would corrupt the reservations file
+    for value in values:
+      if ',' in value or '\n' in value or '\r' in value:
+        raise ValueError('{!r} must not contain commas or newlines.'.format(value))
+
+  def describe_person(self, person):
+    """
+    Describe a person as a dictionary, as returned by the API.
+    :param person: The person to describe.
+    :returns: The dictionary.
+    """
+    return {
+      'first_name': person.first_name,
+      'last_name': person.last_name,
+      'phone': person.phone,
+      'email': person.email,
+      'appointment_types': person.appointment_types,
+      'preferences': person.preferences
+    }
+
+  def keep_person(self, person):
+    """
+    Keep a person, along with a bot to book for them, replacing anyone with the same name.  Call while holding the people lock.
+    :param person: The person.
+    """
+    key = get_person_key(person.first_name, person.last_name)
+    self.people[key] = person
+    self.bots[key] = self.tabs.make_bot(person)
+
+  def add_person(self, data):
+    """
+    Add a person for whom to make reservations, replacing anyone with the same name.
+    :param data: A dictionary describing the person.
+    :returns: The person.
+    """
+    person = self.make_person(data)
+    with self.people_lock:
+      self.keep_person(person)
+      self.save_people()
+    self.logger.info('Daemon: added {} {}'.format(person.first_name, person.last_name))
+    return person
+
+  def remove_person(self, first_name, last_name):
+    """
+    Stop making reservations for a person.
+    :param first_name: The person's first name.
+    :param last_name: The person's last name.
+    :returns: True if the person was removed, False if there was no such person.
+    """
+    key = get_person_key(first_name, last_name)
+    with self.people_lock:
+      person = self.people.pop(key, None)
+      if person is None:
+        return False
+      del self.bots[key]
+      self.save_people()
+    self.logger.info('Daemon: removed {} {}'.format(person.first_name, person.last_name))
+    return True
+
+  def request_scan(self):
+    """
+    Queue up a scan, unless one is already waiting.
+    """
+    if self.tasks.empty():
+      self.tasks.put('scan')
+
+  def scan(self):
+    """
+    Try to make reservations for everyone, in priority order, in tabs of the warm browser.
+    """
+    with self.people_lock:
+      bots = dict(self.bots)
+    if len(bots) == 0:
+      return
+
+    self.scanning = True
+    start = time.time()
+    try:
+      # open the browser the first time, or again if it has crashed
+      if self.tabs.driver is not None and not self.is_browser_alive():
+        self.restart_browser()
+      if self.tabs.driver is None:
+        self.tabs.start_browser()
+
+      # people with fewer acceptable slots in what was available last time go first... the bots then take turns in that order
+      with self.state_lock:
+        people = self.priorities.order([bot.person for bot in bots.values()], availability=self.availability)
+      self.tabs.run([bots[get_person_key(person.first_name, person.last_name)] for person in people])
+
+      # remember how everyone did
+      with self.state_lock:
+        for bot in self.tabs.bots:
+          self.priorities.record(bot.person, bot)
+          self.availability.update(bot.availability)
+          self.add_latency(self.flow_seconds, bot.seconds)
+        self.priorities.save()
+    except Exception as e:
+      self.logger.info('Daemon: error scanning: {}'.format(repr(e)))
+      self.restart_browser()
+    finally:
+      self.scanning = False
+      self.last_scan = time.time()
+      with self.state_lock:
+        self.add_latency(self.scan_seconds, self.last_scan - start)
+
+  def is_browser_alive(self):
+    """
+    Check whether the browser is still responding.
+    :returns: True if it is, False otherwise.
+    """
+    try:
+      self.tabs.driver.window_handles
+      return True
+    except Exception:
+      return False
+
+  def restart_browser(self):
+    """
+    Quit the browser, so that it is started afresh on the next scan.
+    """
+    try:
+      self.tabs.stop_browser()
+    except Exception:
+      self.tabs.driver = None # it's already gone
+
+  def add_latency(self, latencies, seconds):
+    """
+    Keep track of a latency, forgetting old ones.
+    :param latencies: The list of recent latencies.
+    :param seconds: The latency to add.
+    """
+    latencies.append(seconds)
+    del latencies[:-self.history_length]
+
+  def summarize(self, latencies):
+    """
+    Summarize a list of latencies.
+    :param latencies: The latencies, in seconds.
+    :returns: A dictionary of statistics, or None if there are no latencies yet.
+    """
+    if len(latencies) == 0:
+      return None
+    ordered = sorted(latencies)
+    return {
+      'count': len(ordered),
+      'last': latencies[-1],
+      'mean': statistics.mean(ordered),
+      'median': statistics.median(ordered),
+      'p95': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+      'max': ordered[-1]
+    }
+
+  def get_stats(self):
+    """
+    Get latency statistics for recent scans and booking flows.
+    :returns: A dictionary of statistics.
+    """
+    with self.state_lock:
+      return {
+        'scan_seconds': self.summarize(self.scan_seconds),
+        'flow_seconds': self.summarize(self.flow_seconds)
+      }
+
+  def get_status(self):
+    """
+    Get the status of the daemon.
+    :returns: A dictionary describing the daemon's state.
+    """
+    with self.people_lock:
+      people = [self.describe_person(person) for person in self.people.values()]
+    # copy what the scan may be changing, so it can be serialized safely
+    with self.state_lock:
+      availability = copy.deepcopy(self.availability)
+      priorities = copy.deepcopy(self.priorities.state)
+    return {
+      'people': people,
+      'scanning': self.scanning,
+      'queued': self.tasks.qsize(),
+      'last_scan': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.last_scan)) if self.last_scan else None,
+      'availability': availability,
+      'priorities': priorities,
+      'stats': self.get_stats()
+    }
+
+  def run_tasks(self):
+    """
+    Run queued tasks one at a time until stopped.  This is the target of the worker thread.
+    """
+    while self.running:
+      try:
+        task = self.tasks.get(timeout=1)
+      except queue.Empty:
+        continue
+      if task == 'scan':
+        self.scan()
+
+  def run_schedule(self):
+    """
+    Queue up a scan at every interval until stopped.  This is the target of the scheduler thread.
+    """
+    while self.running:
+      self.request_scan()
+      # sleep in short steps, so we stop promptly
+      wake = time.time() + self.interval
+      while self.running and time.time() < wake:
+        time.sleep(1)
+
+  def serve(self, host='127.0.0.1', port=8020):
+    """
+    Run the daemon, serving the API until interrupted.
+    :param host: The address on which to listen.  Keep it local... the API has no authentication.
+    :param port: The port on which to listen.
+    """
+    self.running = True
+    threads = [
+      threading.Thread(target=self.run_tasks, daemon=True),
+      threading.Thread(target=self.run_schedule, daemon=True)
+    ]
+    for thread in threads:
+      thread.start()
+
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.reservation_daemon = self
+    self.logger.info('Daemon: listening on {}:{}'.format(host, port))
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      server.server_close()
+      self.running = False
+      for thread in threads:
+        thread.join()
+      if self.tabs.driver is not None:
+        self.restart_browser()
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+  def send_json(self, status, data):
+    """
+    Send a JSON response.
+    :param status: The HTTP status code.
+    :param data: The data to send.
+    """
+    body = json.dumps(data, indent=2).encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def get_path(self):
+    """
+    Split the request path into its parts, e.g. ['people', 'Katya', 'Bloomberg'].
+    """
+    return [urllib.parse.unquote(part) for part in self.path.split('?')[0].split('/') if part != '']
+
+  def do_GET(self):
+    daemon = self.server.reservation_daemon
+    path = self.get_path()
+    if path == ['status']:
+      self.send_json(200, daemon.get_status())
+    elif path == ['people']:
+      self.send_json(200, daemon.get_status()['people'])
+    elif path == ['stats']:
+      self.send_json(200, daemon.get_stats())
+    else:
+      self.send_json(404, {'error': 'Not found'})
+
+  def do_POST(self):
+    daemon = self.server.reservation_daemon
+    path = self.get_path()
+    if path == ['people']:
+      try:
+        length = int(self.headers.get('Content-Length', 0))
+        person = daemon.add_person(json.loads(self.rfile.read(length)))
+        self.send_json(201, daemon.describe_person(person))
+      except (ValueError, KeyError, TypeError) as e:
+        self.send_json(400, {'error': 'Invalid person: {}'.format(repr(e))})
+    elif path == ['scan']:
+      daemon.request_scan()
+      self.send_json(202, {'queued': daemon.tasks.qsize(), 'scanning': daemon.scanning})
+    else:
+      self.send_json(404, {'error': 'Not found'})
+
+  def do_DELETE(self):
+    daemon = self.server.reservation_daemon
+    path = self.get_path()
+    if len(path) == 3 and path[0] == 'people' and daemon.remove_person(path[1], path[2]):
+      self.send_json(200, {'removed': '{} {}'.format(path[1], path[2])})
+    else:
+      self.send_json(404, {'error': 'Not found'})
+
+  def log_message(self, format, *args):
+    # log requests to our log file rather than to the console
+    self.server.reservation_daemon.logger.info('Daemon: ' + format % args)
+
+# run the daemon
+if __name__ == '__main__':
+  daemon = ReservationDaemon(interval=60)
+  daemon.serve(port=8020)
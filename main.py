@@ -5,15 +5,32 @@ Operate a Silver Lake Reservation Bot.
 
 import schedule
 import time
-import random
 from person import Person
 from reservation_bot import ReservationBot
+from tabbed_reservation_bot import TabScheduler
+from priority_scheduler import PriorityScheduler
+from profiler import Profiler
 
-def try_reservation(people):
-  # shuffle the list of people
-  random.shuffle(people)
+def try_reservation(people, scheduler):
+  # decide who goes first
+  people = scheduler.order(people)
   for person in people:
     bot = ReservationBot(person)
+    bot.make_reservations()
+    scheduler.record(person, bot)
+  # remember how everyone did for next time
+  scheduler.save()
+
+def try_reservation_in_tabs(people, scheduler):
+  # decide who goes first
+  people = scheduler.order(people)
+  # book for everyone from a single browser, one tab per person, handing the browser to whoever comes first in the order
+  tabs = TabScheduler(max_tabs=4)
+  tabs.run([tabs.make_bot(person) for person in people])
+  for bot in tabs.bots:
+    scheduler.record(bot.person, bot)
+  # remember how everyone did for next time
+  scheduler.save()
 
 def main():
   # indicate day/time preferences.
@@ -36,7 +53,21 @@ def main():
     })
   ]
 
-  schedule.every(1).minutes.do(try_reservation, people=people)
+  # who goes first depends on remaining quota, how picky they are, and how often they've lost out lately
+  scheduler = PriorityScheduler()
+
+  job = try_reservation
+  # ... or, to use a single browser with one tab per person, rather than one browser per person
+  # job = try_reservation_in_tabs
+
+  # set to True to log where the time and memory go on each tick, and save detailed captures to logs/profiles
+  # - a capture is saved every hour, or on the next tick after running: kill -USR1 <pid>
+  profile = False
+  if profile:
+    profiler = Profiler(every=60)
+    job = profiler.profile(job)
+
+  schedule.every(1).minutes.do(job, people=people, scheduler=scheduler)
 
   # flush out pending jobs
   while True:
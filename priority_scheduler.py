@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Decide who gets to try booking first when everyone is competing for the same freshly-released slots.
+
+People go first when they have more of their weekly quota left, when they have fewer acceptable slots to choose from,
+and when they have recently lost out on slots they wanted.  This state is saved to file between ticks.
+"""
+
+import os
+import json
+import random
+import datetime
+from reservation_bot import load_reservations, find_reservations, get_start_of_week, get_person_key
+
+class PriorityScheduler():
+
+  def __init__(self, filename='priorities.json', max_per_week=3, weeks=2, history_length=10, quota_weight=1.0, scarcity_weight=1.0, failure_weight=1.0, reservations=None):
+    """
+    Set up the scheduler and load any state saved by previous ticks.
+    :param filename: The file in which to save state between ticks.
+    :param max_per_week: The maximum number of reservations allowed per week.  Defaults to 3.
+    :param weeks: The number of weeks, starting with this one, within which reservations can be made.  The site opens reservations a week in advance, which usually spans two of its weeks.
+    :param history_length: The number of recent outcomes to remember for each person.
+    :param quota_weight: How much remaining weekly quota counts towards going first.
+    :param scarcity_weight: How much having few acceptable slots counts towards going first.
+    :param failure_weight: How much recently losing out counts towards going first.
+    :param reservations: The lines of the reservations file, already loaded, to use instead of re-reading the file.
+    """
+    self.filename = filename
+    self.max_per_week = max_per_week
+    self.weeks = weeks
+    self.history_length = history_length
+    self.quota_weight = quota_weight
+    self.scarcity_weight = scarcity_weight
+    self.failure_weight = failure_weight
+    self.reservations = reservations
+    self.quotas = {} # remaining quota of each person, by name, as of the most recent ordering
+    self.load()
+
+  def load(self):
+    """
+    Load the state saved by previous ticks, if any.
+    """
+    self.state = {}
+    if os.path.exists(self.filename):
+      try:
+        with open(self.filename, 'r') as f:
+          self.state = json.load(f)
+      except ValueError:
+        pass # corrupt file... start over
+
+  def save(self):
+    """
+    Save the state to file for the next tick.
+    """
+    with open(self.filename, 'w') as f:
+      json.dump(self.state, f, indent=2)
+
+  def get_person_state(self, person):
+    """
+    Get the saved state for a person, creating it if necessary.
+    :param person: The person whose state to get.
+    :returns: A dictionary with the number of acceptable 'slots' last seen, or None if never seen, and a 'history' of recent outcomes.
+    """
+    key = get_person_key(person.first_name, person.last_name)
+    if key not in self.state:
+      self.state[key] = {
+        'slots': None,
+        'history': []
+      }
+    return self.state[key]
+
+  def get_reservations(self, person):
+    """
+    Get the reservations on file for a specific person.
+    :param person: The person for whom to check the reservations.
+    :returns: A list of reservations, where each item is a dictionary with reservation 'type', 'date', and 'time' fields.
+    """
+    # read the reservations file, unless we already have its lines
+    lines = self.reservations if self.reservations is not None else load_reservations()
+    return find_reservations(lines, person)
+
+  def get_remaining_quota(self, person, today=None):
+    """
+    Count how many more reservations the person may book within the weeks in which reservations are open.
+    :param person: The person for whom to count.
+    :param today: The date to count from.  Defaults to today.
+    :returns: The number of reservations remaining.
+    """
+    if today is None:
+      today = datetime.date.today()
+
+    # the reservation system's weeks start on Fridays
+    this_week = get_start_of_week('{} {}'.format(today.strftime('%B'), today.day))
+    weeks = [this_week + datetime.timedelta(days=7 * i) for i in range(self.weeks)]
+
+    # count existing reservations in each week
+    counts = {week: 0 for week in weeks}
+    for r in self.get_reservations(person):
+      week = get_start_of_week(r['date'])
+      if week in counts:
+        counts[week] += 1
+
+    return sum([max(self.max_per_week - count, 0) for count in counts.values()])
+
+  def get_slots(self, person, availability=None):
+    """
+    Get the number of acceptable slots for the person in the most recent snapshot of availability.
+    :param person: The person for whom to count slots.
+    :param availability: The most recently scraped date/times for each appointment type, if any, as kept by the bots.  Otherwise, the count saved on the person's last try is used.
+    :returns: The number of slots, or an estimate from the person's preferences if we have never looked.
+    """
+    # count from the snapshot, if it covers what this person wants
+    if availability is not None and any([t in availability for t in person.appointment_types]):
+      return self.count_slots(person, availability)
+
+    slots = self.get_person_state(person)['slots']
+    if slots is None:
+      # estimate from the number of days the person has not excluded
+      days = 7 - len([t for t in person.preferences.values() if t == '-'])
+      slots = days * len(person.appointment_types)
+    return slots
+
+  def count_slots(self, person, availability):
+    """
+    Count the slots in a snapshot of availability that the person has not yet reserved and that match their preferences, the way the bot filters them.
+    :param person: The person for whom to count slots.
+    :param availability: The date/times for each appointment type, where each date is a dictionary with 'date', 'day', and 'times' fields.
+    :returns: The number of slots.
+    """
+    reserved_dates = [r['date'] for r in self.get_reservations(person)]
+    slots = 0
+    for appointment_type in person.appointment_types:
+      for d in availability.get(appointment_type, []):
+        if d['date'] in reserved_dates:
+          continue
+        preferred_time = person.preferences.get(d['day'])
+        if preferred_time is None:
+          slots += len(d['times']) # any time will do
+        elif preferred_time.lower() in d['times']:
+          slots += 1 # only the preferred time will do... and never on excluded days, marked '-'
+    return slots
+
+  def get_priority(self, person, today=None, availability=None):
+    """
+    Calculate how urgently a person should go first.  Each factor is scaled to between 0 and 1 before being weighted.
+    :param person: The person for whom to calculate the priority.
+    :param today: The date to count from.  Defaults to today.
+    :param availability: The most recently scraped date/times for each appointment type, if any.
+    :returns: The priority... higher goes first.
+    """
+    remaining = self.get_remaining_quota(person, today)
+    self.quotas[get_person_key(person.first_name, person.last_name)] = remaining
+
+    # no point going first with nothing left to book
+    if remaining == 0:
+      return 0
+
+    quota = remaining / (self.weeks * self.max_per_week)
+    scarcity = 1 / (1 + self.get_slots(person, availability))
+    failures = self.get_person_state(person)['history'].count('lost') / self.history_length
+
+    return self.quota_weight * quota + self.scarcity_weight * scarcity + self.failure_weight * failures
+
+  def order(self, people, today=None, availability=None):
+    """
+    Put people in the order in which they should try to book.  Ties are broken randomly.
+    :param people: The people to order.
+    :param today: The date to count from.  Defaults to today.
+    :param availability: The most recently scraped date/times for each appointment type, if any, from which to count how many slots each person has to choose from.
+    :returns: A new list of the people, highest priority first.
+    """
+    self.quotas = {} # forget anyone no longer being ordered
+    priorities = {person: self.get_priority(person, today, availability) for person in people}
+    return sorted(people, key=lambda person: (-priorities[person], random.random()))
+
+  def record(self, person, bot):
+    """
+    Remember how a person's booking attempt went.
+    :param person: The person who tried to book.
+    :param bot: The bot that tried to book for them.
+    """
+    state = self.get_person_state(person)
+    state['slots'] = bot.acceptable_slots
+
+    # classify the outcome
+    if bot.bookings > 0:
+      outcome = 'booked'
+    elif self.quotas.get(get_person_key(person.first_name, person.last_name), 0) > 0 and bot.acceptable_slots > 0:
+      outcome = 'lost' # wanted something and didn't get it
+    else:
+      outcome = 'idle' # nothing to book
+
+    state['history'] = (state['history'] + [outcome])[-self.history_length:]
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Profile the ticks of the main loop, to find out where time and memory go.
+
+On every tick, the time spent waiting on the WebDriver's HTTP requests, the time tabs spent idle waiting for their turn,
+the rest of the wall time, spent locally, and the CPU time used are logged, and a tracemalloc snapshot is compared against
+the previous tick's to catch memory that keeps growing.  Every so often, or on the next tick after the process receives
+SIGUSR1, the tick is also captured in detail:
+- a cProfile file for snakeviz, pstats, and the like, covering all threads before Python 3.12, which only allows one
+  cProfile to be active at a time, and the main thread from then on
+- a collapsed-stack file from sampling all threads, ready for flamegraph.pl or speedscope
+- the full comparison of memory allocations against the previous tick
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+from tabbed_reservation_bot import TabbedReservationBot
+
+class Profiler():
+
+  def __init__(self, directory='logs/profiles', every=60, interval=0.01, top=10):
+    """
+    Start profiling.
+    :param directory: The directory in which to save captures.
+    :param every: Capture every this many ticks.  Set to 0 to only capture on SIGUSR1.
+    :param interval: The number of seconds between stack samples.
+    :param top: The number of lines of memory growth to log.
+    """
+    self.directory = directory
+    self.every = every
+    self.interval = interval
+    self.top = top
+    self.ticks = 0
+    self.capture_next = False # whether a capture has been requested by signal
+    self.logger = logging.getLogger('status')
+    os.makedirs(directory, exist_ok=True)
+
+    # capture the next tick when we receive SIGUSR1, e.g. kill -USR1 <pid>
+    if hasattr(signal, 'SIGUSR1'):
+      signal.signal(signal.SIGUSR1, self.request_capture)
+
+    # keep track of memory allocations from now on
+    tracemalloc.start(25)
+    self.baseline = tracemalloc.take_snapshot()
+    self.snapshot = self.baseline
+
+    # time every HTTP request made to the WebDriver
+    self.webdriver_seconds = 0
+    self.webdriver_requests = 0
+    self.webdriver_lock = threading.Lock()
+    self.original_request = RemoteConnection._request
+    profiler = self
+    def _request(connection, *args, **kwargs):
+      start = time.time()
+      try:
+        return profiler.original_request(connection, *args, **kwargs)
+      finally:
+        profiler.add_webdriver_time(time.time() - start)
+    RemoteConnection._request = _request
+
+    # time every wait of a tab for its turn to drive the shared browser, which is idle rather than local work
+    self.idle_seconds = 0
+    self.original_wait_for_turn = TabbedReservationBot.wait_for_turn
+    def wait_for_turn(bot, *args, **kwargs):
+      start = time.time()
+      try:
+        return profiler.original_wait_for_turn(bot, *args, **kwargs)
+      finally:
+        profiler.add_idle_time(time.time() - start)
+    TabbedReservationBot.wait_for_turn = wait_for_turn
+
+  def stop(self):
+    """
+    Stop profiling.
+    """
+    RemoteConnection._request = self.original_request
+    TabbedReservationBot.wait_for_turn = self.original_wait_for_turn
+    tracemalloc.stop()
+    if hasattr(signal, 'SIGUSR1'):
+      signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+
+  def request_capture(self, signum=None, frame=None):
+    """
+    Capture the next tick in detail.  This is the SIGUSR1 handler.
+    """
+    self.capture_next = True
+
+  def add_webdriver_time(self, seconds):
+    """
+    Add to the time spent waiting on the WebDriver.
+    :param seconds: The duration of a WebDriver request.
+    """
+    with self.webdriver_lock:
+      self.webdriver_seconds += seconds
+      self.webdriver_requests += 1
+
+  def add_idle_time(self, seconds):
+    """
+    Add to the time tabs spent waiting for their turn.
+    :param seconds: The duration of a wait.
+    """
+    with self.webdriver_lock:
+      self.idle_seconds += seconds
+
+  def profile(self, job):
+    """
+    Wrap a job so that each time it runs, it is profiled as one tick.
+    :param job: The function to profile, e.g. try_reservation.
+    :returns: The wrapped function.
+    """
+    def profiled_job(*args, **kwargs):
+      return self.run_tick(job, *args, **kwargs)
+    return profiled_job
+
+  def run_tick(self, job, *args, **kwargs):
+    """
+    Run one tick of a job, profiling it.
+    :param job: The function to run.
+    :returns: Whatever the job returns.
+    """
+    self.ticks += 1
+    capture = self.capture_next or (self.every > 0 and self.ticks % self.every == 0)
+    self.capture_next = False
+    label = 'tick-{}-{}'.format(self.ticks, time.strftime('%Y%m%d-%H%M%S'))
+
+    with self.webdriver_lock:
+      self.webdriver_seconds = 0
+      self.webdriver_requests = 0
+      self.idle_seconds = 0
+
+    # start the detailed capture, if it's time
+    if capture:
+      sampler = StackSampler(self.interval)
+      sampler.start()
+
+      # cProfile only sees the thread that enables it, so give each thread started during the tick, e.g. each tab, its own
+      # ... except from Python 3.12, where a second active cProfile raises an error, so the sampled stacks have to do for other threads
+      thread_profiles = []
+      if sys.version_info < (3, 12):
+        def start_thread_profile(frame, event, arg):
+          try:
+            thread_profile = cProfile.Profile()
+            thread_profile.enable() # replaces this hook for the rest of the thread
+            thread_profiles.append(thread_profile)
+          except Exception:
+            sys.setprofile(None) # never let profiling stop the thread from doing its job
+        threading.setprofile(start_thread_profile)
+
+      profile = cProfile.Profile()
+      try:
+        profile.enable()
+      except ValueError:
+        profile = None # something else is already profiling
+    else:
+      sampler = None
+
+    start = time.time()
+    cpu_start = time.process_time()
+    try:
+      return job(*args, **kwargs)
+    finally:
+      # take readings before any profiling work of our own, and leave out the CPU time the sampler used meanwhile
+      wall = time.time() - start
+      cpu = time.process_time() - cpu_start
+
+      if capture:
+        if profile is not None:
+          profile.disable()
+        threading.setprofile(None)
+        sampler.stop()
+        cpu = max(cpu - sampler.cpu_seconds, 0)
+        profiles = [p for p in [profile] + thread_profiles if p is not None]
+        if len(profiles) > 0:
+          pstats.Stats(*profiles).dump_stats(os.path.join(self.directory, '{}.prof'.format(label)))
+        sampler.save(os.path.join(self.directory, '{}.folded'.format(label)))
+        self.logger.info('Profile: saved {} with {} profiled threads and {} samples to {}'.format(label, len(profiles), sampler.samples, self.directory))
+
+      self.log_time(wall, cpu)
+      self.log_memory(label, capture)
+
+  def log_time(self, wall, cpu):
+    """
+    Log how the tick's wall time splits between waiting on the WebDriver, tabs waiting for their turn, and running locally, along with the CPU time used.
+    :param wall: The wall time of the tick, in seconds.
+    :param cpu: The CPU time used by this process during the tick, not counting the profiler's own, in seconds.
+    """
+    with self.webdriver_lock:
+      webdriver = self.webdriver_seconds
+      requests = self.webdriver_requests
+      idle = self.idle_seconds
+
+    # whatever wall time was not spent waiting was spent locally
+    # ... when several tabs run at once, their waits overlap and are summed across threads, so can add up to more than the wall time
+    local = max(wall - webdriver - idle, 0)
+    self.logger.info('Profile: tick {} took {:.1f}s: {:.1f}s waiting on {} WebDriver requests, {:.1f}s tabs waiting for their turn, {:.1f}s local wall time, {:.1f}s CPU'.format(self.ticks, wall, webdriver, requests, idle, local, cpu))
+
+  def log_memory(self, label, capture=False):
+    """
+    Log the memory that has grown the most since the previous tick, and save the full comparison if capturing.
+    :param label: The label of this tick.
+    :param capture: Whether this tick is being captured in detail.
+    """
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+      tracemalloc.Filter(False, tracemalloc.__file__),
+      tracemalloc.Filter(False, __file__), # leave out the profiler itself
+      tracemalloc.Filter(False, '<frozen importlib._bootstrap>')
+    ])
+    growth = snapshot.compare_to(self.snapshot, 'lineno')
+    total = sum([stat.size for stat in snapshot.statistics('filename')])
+    since_start = total - sum([stat.size for stat in self.baseline.statistics('filename')])
+    self.snapshot = snapshot
+
+    self.logger.info('Profile: {:.1f}MB traced, {:+.1f}MB since profiling started'.format(total / 2**20, since_start / 2**20))
+    for stat in growth[:self.top]:
+      if stat.size_diff > 0:
+        self.logger.info('Profile: {}'.format(stat))
+
+    # save the full comparison
+    if not capture:
+      return
+    with open(os.path.join(self.directory, '{}-memory.txt'.format(label)), 'w') as f:
+      for stat in growth:
+        f.write('{}\n'.format(stat))
+
+class StackSampler():
+
+  def __init__(self, interval=0.01):
+    """
+    Periodically sample the call stacks of all threads.
+    :param interval: The number of seconds between samples.
+    """
+    self.interval = interval
+    self.stacks = {} # the number of times each collapsed stack was seen
+    self.samples = 0
+    self.cpu_seconds = 0 # the CPU time spent sampling, so it can be left out of the tick's
+    self.running = False
+
+  def start(self):
+    """
+    Start sampling in the background.
+    """
+    self.running = True
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def stop(self):
+    """
+    Stop sampling.
+    """
+    self.running = False
+    self.thread.join()
+
+  def run(self):
+    """
+    Take samples until stopped.  This is the target of the sampling thread.
+    """
+    cpu_start = time.thread_time()
+    while self.running:
+      for thread_id, frame in sys._current_frames().items():
+        # don't sample ourselves
+        if thread_id == self.thread.ident:
+          continue
+
+        # walk the stack from the innermost frame outwards
+        names = []
+        while frame is not None:
+          code = frame.f_code
+          names.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+          frame = frame.f_back
+
+        stack = ';'.join(reversed(names)) # outermost first
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+      self.samples += 1
+      self.cpu_seconds = time.thread_time() - cpu_start
+      time.sleep(self.interval)
+
+  def save(self, filename):
+    """
+    Save the samples in collapsed-stack format, one stack and its count per line.
+    :param filename: The file in which to save the samples.
+    """
+    with open(filename, 'w') as f:
+      for stack, count in self.stacks.items():
+        f.write('{} {}\n'.format(stack, count))
@@ -14,85 +14,223 @@ from selenium import webdriver
 from selenium.webdriver import ActionChains
 from selenium.webdriver.common.keys import Keys
 
+def start_browser(hidden=True, page_load_strategy=None):
+  """
+  Launch a new instance of google chrome controlled by the webdriver.
+  :param hidden: Whether to show the web browser or keep it hidden.
+  :param page_load_strategy: How long the webdriver waits for pages to load, e.g. 'none' to not wait at all.  Defaults to the webdriver's 'normal', which waits until each page has loaded.
+  :returns: The webdriver controlling the new browser.
+  """
+  chrome_options = webdriver.ChromeOptions()  # set some options
+  chrome_options.add_argument('--start-maximized') # max height
+  if hidden:
+    # hide Chrome from user
+    chrome_options.add_argument("--headless")
+  if page_load_strategy is not None:
+    chrome_options.set_capability('pageLoadStrategy', page_load_strategy)
+  return webdriver.Chrome(options=chrome_options)
+
+def start_logging(filename='log.txt', level=logging.INFO):
+  """
+  Set up logging to file for the whole program.  Only the first call has any effect.
+  :param filename: A file in which to save the logs.
+  :param level: The minimum level of messages to log.
+  """
+  logging.basicConfig(
+    level=level,
+    # format="%(asctime)s %(levelname)s %(threadName)s %(name)s %(message)s",
+    format="%(asctime)s %(message)s",
+    datefmt='%Y-%m-%d %H:%M:%S',
+    filename=filename,
+    filemode='a'
+  )
+
+def load_reservations(filename='reservations.txt'):
+  """
+  Read all the reservations on file, for everyone.
+  :param filename: The file in which reservations are saved.
+  :returns: A list of the lines in the file, or an empty list if there is no file yet.
+  """
+  try:
+    with open(filename, 'r') as f:
+      return f.readlines()
+  except IOError:
+    return []
+
+def get_start_of_week(date, week_start_day=4):
+  """
+  Determine the date of the start of the week within which this date falls.
+  :param date: A poorly-formatted date, without the year, such as 'July 10'
+  :param week_start_day: The day that is considered the start of the week, as ant where 0=Monday, 1=Tuesday, etc.
+  :returns: The date of the start of the week within this date falls.
+  """
+  # use the current year, since the year is missing from the date
+  year = str(datetime.date.today().year)
+
+  # convert date to date object
+  date = '{} {}'.format(date, year) # tack on year to reservation date
+  dt = datetime.datetime.strptime(date, '%B %d %Y')
+  # week_start = dt - datetime.timedelta(days=dt.weekday()) # if the week starts on Monday
+  # if the week starts on a different day, as is the case for this reservation system
+  if dt.weekday() >= week_start_day:
+    # for Friday (4), Saturday (5), or Sunday (6)...
+    offset = dt.weekday() - week_start_day # e.g., for Sunday: 6 - 4 = 2; for Saturday: 5 - 4 = 1, etc.
+  else:
+    # for days earlier than Friday (i.e., < 4)...
+    offset = dt.weekday() + (7 - week_start_day) # e.g., for Thursday 3 + 3 = 6; for Wednesday 2 + 3 = 5
+  # offset by as many days as necessary to get to Friday
+  week_start = dt - datetime.timedelta(days=offset)
+  return week_start
+
+def find_reservations(lines, person):
+  """
+  Pick out a specific person's reservations from the lines of the reservations file.
+  :param lines: The lines of the reservations file.
+  :param person: The person for whom to find the reservations.
+  :returns: A list of reservations, where each item is a dictionary with reservation 'type', 'date', and 'time' fields.
+  """
+  reservations = []
+
+  # loop through each line
+  for line in lines:
+    line = line.strip()
+    # get data from the line
+    rdate, rtime, rtype, rfname, rlname = line.split(',')
+    # check for a match
+    if person.first_name.lower() == rfname.lower() and person.last_name.lower() == rlname.lower():
+      # it's a match!
+      reservation = {
+        'type': rtype,
+        'date': rdate,
+        'time': rtime
+      }
+      # add to list
+      reservations.append(reservation)
+
+  return reservations
+
+def get_person_key(first_name, last_name):
+  """
+  Make the key under which a person is kept, e.g. by the daemon and the PriorityScheduler.  Like the reservations file, it ignores case.
+  :param first_name: The person's first name.
+  :param last_name: The person's last name.
+  :returns: The key.
+  """
+  return '{} {}'.format(first_name, last_name).lower()
+
 class ReservationBot():
 
-  def __init__(self, person, max_per_week=3, hidden=True, log=True):
+  def __init__(self, person, max_per_week=3, hidden=True, log=True, reservations=None):
     """
-    Instantiate the bot object with settings.
+    Instantiate the bot object with settings.  The bot can be kept around to make reservations again and again.
     :param person: The person object for whom to make a reservation.
     :param max_per_week: The maximum number of reservations allowed per week.  Defaults to 3.
     :param hidden: Whether to show the web browser or keep it hidden.
+    :param log: Whether to log progress.
+    :param reservations: The lines of the reservations file, already loaded, to use and keep up to date instead of re-reading the file.
     """
+    self.person = person
+    self.max_per_week = max_per_week
+    self.hidden = hidden
+    self.reservations = reservations
+    self.is_logging = False
+
     # start logging
     if log:
       self.start_logging('logs/log.txt')
-      self.log('Starting for {} {}'.format(person.first_name, person.last_name))
+
+    self.bookings = 0 # the number of date/times booked by this bot on its most recent try
+    self.acceptable_slots = 0 # the number of unreserved date/times that matched the person's preferences on its most recent try
+    self.availability = {} # the date/times found for each appointment type on its most recent try, without references to the page
+
+  def make_reservations(self):
+    """
+    Try to make reservations for every appointment type the person wants.
+    """
+    if self.is_logging:
+      self.log('Starting for {} {}'.format(self.person.first_name, self.person.last_name))
+
+    # start counting afresh
+    self.bookings = 0
+    self.acceptable_slots = 0
+    self.availability = {}
 
     # loop through each desired appointment_type
-    appointment_types = person.appointment_types # how the site groups appointments e.g. ["11:30 and 2:30", "5:30", "Senior Swim"]. 
+    appointment_types = self.person.appointment_types # how the site groups appointments e.g. ["11:30 and 2:30", "5:30", "Senior Swim"]. 
     for appointment_type in appointment_types:
+      self.make_reservation(self.person, appointment_type, self.max_per_week, self.hidden)
 
-      # try to run the bot for this appouintment type
-      try:
+    # end for
 
-        # open the web site in google chrome
-        self.start_session('https://silverlakereservations.as.me', hidden)
+  def make_reservation(self, person, appointment_type, max_per_week=3, hidden=True):
+    """
+    Run the full booking flow for a single appointment type, from opening the web site to saving the reservation.
+    :param person: The person object for whom to make a reservation.
+    :param appointment_type: The type of appointment to book, e.g. "5:30".
+    :param max_per_week: The maximum number of reservations allowed per week.
+    :param hidden: Whether to show the web browser or keep it hidden.
+    """
+    # try to run the bot for this appouintment type
+    try:
+      # open the web site in google chrome
+      self.start_session('https://silverlakereservations.as.me', hidden)
 
-        # get available dates for the desired appointment type
-        dates = self.get_available_dates(appointment_type)
-        # print('\nall:')
-        # [print(d['date'], d['day'], d['times']) for d in dates]
+      # get available dates for the desired appointment type
+      dates = self.get_available_dates(appointment_type)
+      self.availability[appointment_type] = [{'date': d['date'], 'day': d['day'], 'times': [t['time'] for t in d['times']]} for d in dates]
+      # print('\nall:')
+      # [print(d['date'], d['day'], d['times']) for d in dates]
 
-        # filename = 'logs/no-dates-{}.png'.format(datetime.date.today())
-        # self.save_screenshot(filename)
+      # filename = 'logs/no-dates-{}.png'.format(datetime.date.today())
+      # self.save_screenshot(filename)
 
-        # filter the available dates
+      # filter the available dates
 
-        dates = self.filter_by_unreserved(dates, person) # by only those that this person has not yet reserved
-        # print('\nunreserved dates:')
-        # [print(d['date'], d['day'], d['times']) for d in dates]
+      dates = self.filter_by_unreserved(dates, person) # by only those that this person has not yet reserved
+      # print('\nunreserved dates:')
+      # [print(d['date'], d['day'], d['times']) for d in dates]
 
-        dates = self.filter_by_time_preferences(dates, person) # by only those with times that match the person's preferences
-        # print('\npreferred dates:')
-        # [print(d['date'], d['day'], d['times']) for d in dates]
+      dates = self.filter_by_time_preferences(dates, person) # by only those with times that match the person's preferences
+      # print('\npreferred dates:')
+      # [print(d['date'], d['day'], d['times']) for d in dates]
 
-        dates = self.limit_per_day(dates) # for any day with multiple times, keep only the first time
-        # print('\nlimit 1 per day:')
-        # [print(d['date'], d['day'], d['times']) for d in dates]
+      self.acceptable_slots += sum([len(d['times']) for d in dates]) # keep track of how many options this person had
 
-        dates = self.limit_per_week(dates, person, max_per_week) # limit the number of reservations per week we book
-        # print('\nlimit 3 per week:')
-        # [print(d['date'], d['day'], d['times']) for d in dates]
-        
-        # proceed if we have dates to reserve
-        if len(dates) > 0:
+      dates = self.limit_per_day(dates) # for any day with multiple times, keep only the first time
+      # print('\nlimit 1 per day:')
+      # [print(d['date'], d['day'], d['times']) for d in dates]
 
-          # click on the date/times we want to reserve
-          self.select_dates(dates)
+      dates = self.limit_per_week(dates, person, max_per_week) # limit the number of reservations per week we book
+      # print('\nlimit 3 per week:')
+      # [print(d['date'], d['day'], d['times']) for d in dates]
+      
+      # proceed if we have dates to reserve
+      if len(dates) > 0:
 
-          # fill in personal details
-          self.enter_personal_details(person)
+        # click on the date/times we want to reserve
+        self.select_dates(dates)
 
-          # submit the form
-          self.submit_form()
+        # fill in personal details
+        self.enter_personal_details(person)
 
-          # save reservation
-          self.save_reservation(dates, person)
+        # submit the form
+        self.submit_form()
 
-          # save screenshot
-          clean_dates = '-'.join(['{}-{}'.format(d['date'], '-'.join([t['time'] for t in d['times']])) for d in dates])  # string of dates
-          filename = 'logs/{}-{}-{}.png'.format(person.last_name, person.first_name, clean_dates)
-          self.save_screenshot(filename)
+        # save reservation
+        self.save_reservation(dates, person)
 
-      except Exception as e:
-        # the desired appointment type was not found
-        self.log('Error: {}'.format(repr(e)))
+        # save screenshot
+        clean_dates = '-'.join(['{}-{}'.format(d['date'], '-'.join([t['time'] for t in d['times']])) for d in dates])  # string of dates
+        filename = 'logs/{}-{}-{}.png'.format(person.last_name, person.first_name, clean_dates)
+        self.save_screenshot(filename)
 
-      # open the web site in google chrome
-      if hasattr(self, 'driver'):
-        self.end_session()
+    except Exception as e:
+      # the desired appointment type was not found
+      self.log('Error: {}'.format(repr(e)))
 
-    # end for
+    # open the web site in google chrome
+    if hasattr(self, 'driver'):
+      self.end_session()
 
   def start_session(self, url, hidden=True):
     """
@@ -101,12 +239,7 @@ class ReservationBot():
     :param hidden: Whether to show the web browser.
     """
     # open the webdriver
-    chrome_options = webdriver.ChromeOptions()  # set some options
-    chrome_options.add_argument('--start-maximized') # max height
-    if hidden:
-      # hide Chrome from user
-      chrome_options.add_argument("--headless")
-    self.driver = webdriver.Chrome(options=chrome_options)
+    self.driver = start_browser(hidden)
     self.driver.get(url)
 
     # pause while page loads reservation content after initial page load
@@ -128,14 +261,7 @@ class ReservationBot():
     self.is_logging = True
 
     # logging
-    logging.basicConfig(
-      level=level,
-      # format="%(asctime)s %(levelname)s %(threadName)s %(name)s %(message)s",
-      format="%(asctime)s %(message)s",
-      datefmt='%Y-%m-%d %H:%M:%S',
-      filename=filename,
-      filemode='a'
-    )
+    start_logging(filename, level)
     self.logger = logging.getLogger(logger_name)
 
   def log(self, msg):
@@ -429,23 +555,7 @@ class ReservationBot():
     :param week_start_day: The day that is considered the start of the week, as ant where 0=Monday, 1=Tuesday, etc.
     :returns: The date of the start of the week within this date falls.
     """
-    # use the current year, since the year is missing from the date
-    year = str(datetime.date.today().year)
-
-    # convert date to date object
-    date = '{} {}'.format(date, year) # tack on year to reservation date
-    dt = datetime.datetime.strptime(date, '%B %d %Y')
-    # week_start = dt - datetime.timedelta(days=dt.weekday()) # if the week starts on Monday
-    # if the week starts on a different day, as is the case for this reservation system
-    if dt.weekday() >= week_start_day:
-      # for Friday (4), Saturday (5), or Sunday (6)...
-      offset = dt.weekday() - week_start_day # e.g., for Sunday: 6 - 4 = 2; for Saturday: 5 - 4 = 1, etc.
-    else:
-      # for days earlier than Friday (i.e., < 4)...
-      offset = dt.weekday() + (7 - week_start_day) # e.g., for Thursday 3 + 3 = 6; for Wednesday 2 + 3 = 5
-    # offset by as many days as necessary to get to Friday
-    week_start = dt - datetime.timedelta(days=offset)
-    return week_start
+    return get_start_of_week(date, week_start_day)
 
   def get_reservations(self, person):
     """
@@ -453,29 +563,15 @@ class ReservationBot():
     :param person: The person for whom to check the reservations.
     :returns: A list of reservations, where each item is a dictionary with reservation 'type', 'date', and 'time' fields.
     """
-    # open up reservations file
-    f = open('reservations.txt', 'r')
-
-    reservations = []
-
-    # loop through each line
-    for line in f:
-      line = line.strip()
-      # get data from the line
-      rdate, rtime, rtype, rfname, rlname = line.split(',')
-      # check for a match
-      if person.first_name.lower() == rfname.lower() and person.last_name.lower() == rlname.lower():
-        # it's a match!
-        reservation = {
-          'type': rtype,
-          'date': rdate,
-          'time': rtime
-        }
-        # add to list
-        reservations.append(reservation)
-
-    f.close() # close file
-    return reservations
+    # open up reservations file, unless we already have its lines
+    if self.reservations is not None:
+      lines = self.reservations
+    else:
+      f = open('reservations.txt', 'r')
+      lines = f.readlines()
+      f.close() # close file
+
+    return find_reservations(lines, person)
     
   def reservation_exists(self, person, date, time):
     """
@@ -643,6 +739,9 @@ class ReservationBot():
             lname=person.last_name
           )
           f.write(line)
+          if self.reservations is not None:
+            self.reservations.append(line) # keep our copy up to date
+          self.bookings += 1 # keep count of what we have booked
           self.log('Saved line: {}'.format(line))
       f.close()
     except Exception as e:
@@ -660,4 +759,5 @@ if __name__ == '__main__':
     'Sunday': '-', # do not book
   }
   person = Person('Alice', 'Moore', '914-271-8239', 'alice.moore@safetymail.info', preferences)
-  bot = ReservationBot(person, appointment_type='Senior Swim', hidden=False)
+  bot = ReservationBot(person, hidden=False)
+  bot.make_reservations()
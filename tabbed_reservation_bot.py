@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Make reservations for several people at once from a single instance of Google Chrome.
+
+Each person's booking flow runs in its own tab.  Only one flow drives the browser at any moment - the others are waiting
+on the site to load dynamic content.  Whenever a flow pauses, it hands the browser over to the next flow that is ready,
+so one tab can fill in its form while another tab waits on the site.  The shared browser does not wait for pages to load
+before handing control back, so page loads are waited out the same way, with other tabs driving the browser meanwhile.
+
+Tabs only run at the same time when each can be given its own browser context, so one person's selections can never be
+submitted with another person's details.  Otherwise, the tabs take turns, one at a time.
+"""
+
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+from reservation_bot import ReservationBot, start_browser
+
+class TabbedReservationBot(ReservationBot):
+
+  def __init__(self, person, scheduler, max_per_week=3, log=True, rank=0):
+    """
+    Instantiate a bot that makes its reservations in its own tab of a shared browser.
+    :param person: The person object for whom to make a reservation.
+    :param scheduler: The TabScheduler that owns the shared browser.
+    :param max_per_week: The maximum number of reservations allowed per week.  Defaults to 3.
+    :param log: Whether to log progress.
+    :param rank: The person's position in the order in which people should book.  Whenever several tabs are ready to drive the browser, the lowest rank goes first.
+    """
+    self.scheduler = scheduler
+    self.rank = rank
+    self.driver = scheduler.driver # the browser shared by all tabs
+    self.handle = None # the window handle of this bot's tab, once open
+    self.context_id = None # the isolated browser context of this bot's tab, if any
+    self.memory = [] # memory samples taken at the end of each booking flow
+    super().__init__(person, max_per_week=max_per_week, hidden=True, log=log, reservations=scheduler.reservations)
+
+  def make_reservations(self):
+    """
+    Wait our turn to drive the browser, then run the booking flows as usual.
+    """
+    self.driver = self.scheduler.driver # the browser may have been restarted since last time
+    self.memory = []
+
+    self.wait_for_turn(holding=False)
+    try:
+      super().make_reservations()
+    finally:
+      self.scheduler.lock.release()
+
+  def start_session(self, url, hidden=True):
+    """
+    Load the web site in a new tab of the shared browser.
+    :param url: The web site to load.
+    :param hidden: Ignored... the shared browser is already open.
+    """
+    self.handle = self.open_tab()
+    self.driver.switch_to.window(self.handle)
+    self.driver.get(url) # returns right away, since the shared browser does not wait for pages to load
+
+    # pause while page loads reservation content after initial page load
+    self.pause(2)
+
+  def open_tab(self):
+    """
+    Open a new tab, in its own browser context if the scheduler runs tabs at the same time, so its cookies and cart are not shared with other tabs.
+    :returns: The window handle of the new tab.
+    """
+    # start from the home tab, since the previous tab may have been closed
+    self.driver.switch_to.window(self.scheduler.home_handle)
+
+    # tabs only run one at a time when separate browser contexts are not supported, so a plain tab is safe
+    if not self.scheduler.isolated:
+      existing_handles = self.driver.window_handles
+      self.driver.execute_script('window.open("about:blank", "_blank");')
+      new_handles = [h for h in self.driver.window_handles if h not in existing_handles]
+      return new_handles[0]
+
+    # otherwise, other tabs are running, so never fall back to a tab that shares their cookies and cart
+    self.context_id, handle = open_isolated_tab(self.driver)
+    if handle is None:
+      self.dispose_context()
+      raise Exception('Could not open a tab in a separate browser context.')
+    return handle
+
+  def end_session(self):
+    """
+    Close this bot's tab, leaving the shared browser open for the other tabs.
+    """
+    # nothing to do if the tab was never opened
+    if self.handle is None:
+      return
+
+    try:
+      # close() closes whichever tab is current, so make sure it's ours, never another flow's or the home tab
+      self.driver.switch_to.window(self.handle)
+
+      # take note of how much memory this booking flow used
+      self.memory.append(self.scheduler.sample_memory())
+
+      self.driver.close()
+    except Exception as e:
+      self.log('Error closing tab: {}'.format(e))
+
+    self.handle = None
+    self.dispose_context()
+
+  def dispose_context(self):
+    """
+    Discard this bot's browser context, if any, along with any tabs still open in it.
+    """
+    if self.context_id is None:
+      return
+
+    try:
+      # devtools commands go through the current tab, which may have just been closed
+      self.driver.switch_to.window(self.scheduler.home_handle)
+      self.driver.execute_cdp_cmd('Target.disposeBrowserContext', {'browserContextId': self.context_id})
+    except Exception as e:
+      self.log('Error disposing of browser context: {}'.format(e))
+    self.context_id = None
+
+  def pause(self, seconds, timeout=30):
+    """
+    Pause for specified number of seconds, and then until our tab's page has loaded, letting other tabs drive the browser in the meantime.
+    :param seconds: The number of seconds to pause.
+    :param timeout: The maximum number of seconds to wait for the page to load, after the pause.
+    """
+    self.wait_for_turn(seconds)
+
+    # make sure the browser is looking at our tab again
+    self.driver.switch_to.window(self.handle)
+
+    # the shared browser does not wait for pages to load, so check, and if not yet loaded, let other tabs go again
+    give_up = time.time() + timeout
+    while self.driver.execute_script('return document.readyState;') != 'complete' and time.time() < give_up:
+      self.wait_for_turn(0.25)
+      self.driver.switch_to.window(self.handle)
+
+  def wait_for_turn(self, seconds=0, holding=True):
+    """
+    Let other tabs drive the browser for at least the specified number of seconds, then wait for our turn to drive it again.
+    :param seconds: The number of seconds to sleep before waiting for our turn.
+    :param holding: Whether we are currently driving the browser.
+    """
+    if holding:
+      self.scheduler.lock.release()
+    try:
+      time.sleep(seconds)
+    finally:
+      self.scheduler.lock.acquire(self.rank)
+
+  def log(self, msg):
+    """
+    Logs a message, labeled with the person this tab is booking for.
+    :param msg: The message to log.
+    """
+    super().log('[{} {}] {}'.format(self.person.first_name, self.person.last_name, msg))
+
+def open_isolated_tab(driver):
+  """
+  Open a new tab in its own browser context, which is like a separate incognito profile.
+  :param driver: The webdriver controlling the browser.
+  :returns: A tuple of the id of the new browser context, or None if it could not be created, and the window handle of the new tab, or None if the webdriver cannot see it.
+  """
+  context_id = None
+  try:
+    context_id = driver.execute_cdp_cmd('Target.createBrowserContext', {})['browserContextId']
+    target = driver.execute_cdp_cmd('Target.createTarget', {
+      'url': 'about:blank',
+      'browserContextId': context_id
+    })
+    # depending on the chromedriver version, handles are either the target id or prefixed with 'CDwindow-'
+    handles = [h for h in driver.window_handles if h.endswith(target['targetId'])]
+    if len(handles) > 0:
+      return context_id, handles[0]
+
+    # this chromedriver cannot see tabs outside the default context
+    logging.getLogger('status').info('Tab in separate browser context not visible to webdriver.')
+  except Exception as e:
+    logging.getLogger('status').info('Error creating separate browser context: {}'.format(e))
+  return context_id, None
+
+class TurnLock():
+
+  def __init__(self):
+    """
+    A lock that, when released, goes to whichever waiting flow has the lowest rank, rather than to whichever gets there first.
+    """
+    self.condition = threading.Condition()
+    self.held = False
+    self.waiting = [] # a heap of the (rank, ticket) of each waiting flow... tickets break ties in order of arrival
+    self.tickets = itertools.count()
+
+  def acquire(self, rank=0):
+    """
+    Wait until the lock is free and no waiting flow outranks us, then take it.
+    :param rank: The rank of the flow waiting... lower goes first.
+    """
+    with self.condition:
+      turn = (rank, next(self.tickets))
+      heapq.heappush(self.waiting, turn)
+      try:
+        while self.held or self.waiting[0] != turn:
+          self.condition.wait()
+      except BaseException:
+        # give up our place in line, e.g. on KeyboardInterrupt, so the flows behind us are not stuck
+        self.waiting.remove(turn)
+        heapq.heapify(self.waiting)
+        self.condition.notify_all()
+        raise
+      heapq.heappop(self.waiting)
+      self.held = True
+
+  def release(self):
+    """
+    Free the lock, and wake the waiting flows so the one with the lowest rank can take it.
+    """
+    with self.condition:
+      self.held = False
+      self.condition.notify_all()
+
+class TabScheduler():
+
+  def __init__(self, max_tabs=4, max_per_week=3, hidden=True, reservations=None):
+    """
+    Set up a scheduler that interleaves several booking flows within one browser.
+    :param max_tabs: The maximum number of booking flows to run at once.
+    :param max_per_week: The maximum number of reservations allowed per week.  Defaults to 3.
+    :param hidden: Whether to show the web browser or keep it hidden.
+    :param reservations: The lines of the reservations file, already loaded, for the bots to share instead of re-reading the file.
+    """
+    self.max_tabs = max_tabs
+    self.max_per_week = max_per_week
+    self.hidden = hidden
+    self.reservations = reservations
+    self.driver = None # the shared browser, once started
+    self.home_handle = None # a tab that is never closed, so the browser stays open between flows
+    self.lock = TurnLock() # held by whichever flow is currently driving the browser, handed out in priority order
+    self.tabs = threading.Semaphore(max_tabs) # limits the number of open tabs
+    self.isolated = False # whether each tab can be given its own browser context, checked when the browser starts
+    self.bots = [] # the bots that completed the most recent run
+    self.logger = logging.getLogger('status')
+
+  def start_browser(self):
+    """
+    Launch the shared browser, and check whether tabs can be kept apart, which decides how many may run at once.
+    """
+    # don't wait for pages to load while driving the browser... flows wait out page loads themselves, letting other tabs go meanwhile
+    self.driver = start_browser(self.hidden, page_load_strategy='none')
+    self.home_handle = self.driver.current_window_handle
+
+    # tabs that share cookies could submit one person's selections with another person's details, so must not overlap
+    self.isolated = self.check_isolation()
+    if self.isolated:
+      self.tabs = threading.Semaphore(self.max_tabs)
+    else:
+      self.logger.info('Tabs: separate browser contexts not supported, so running one tab at a time.')
+      self.tabs = threading.Semaphore(1)
+
+  def check_isolation(self):
+    """
+    Check whether the shared browser can open tabs in separate browser contexts that the webdriver can drive.
+    :returns: True if so, False otherwise.
+    """
+    context_id, handle = open_isolated_tab(self.driver)
+    if context_id is not None:
+      try:
+        # discard the test tab along with its context
+        self.driver.switch_to.window(self.home_handle)
+        self.driver.execute_cdp_cmd('Target.disposeBrowserContext', {'browserContextId': context_id})
+      except Exception as e:
+        self.logger.info('Error disposing of browser context: {}'.format(e))
+    self.driver.switch_to.window(self.home_handle)
+    return handle is not None
+
+  def stop_browser(self):
+    """
+    Quit the shared browser.
+    """
+    self.driver.quit()
+    self.driver = None
+    self.home_handle = None
+    self.isolated = False
+
+  def make_bot(self, person):
+    """
+    Make a bot that books for a person in a tab of the shared browser.  It can be run again and again.
+    :param person: The person for whom to make reservations.
+    :returns: The bot.
+    """
+    return TabbedReservationBot(person, self, max_per_week=self.max_per_week)
+
+  def run(self, bots):
+    """
+    Make reservations with a list of bots, each in their own tab.
+    :param bots: The bots, from make_bot, in the order in which their people should book.
+    :returns: A dictionary of statistics about the run.
+    """
+    # launch the browser just for this run, unless it's already open
+    own_browser = self.driver is None
+    if own_browser:
+      self.start_browser()
+
+    try:
+      start = time.time()
+      self.bots = []
+      threads = []
+
+      # start a flow for each person as soon as a tab is free... those earlier in the list also get the browser first whenever several tabs are ready
+      for rank, bot in enumerate(bots):
+        self.tabs.acquire()
+        thread = threading.Thread(target=self.run_flow, args=(bot, rank, self.bots))
+        thread.start()
+        threads.append(thread)
+
+      # wait for all flows to complete
+      for thread in threads:
+        thread.join()
+
+      return self.get_stats(self.bots, time.time() - start)
+    finally:
+      if own_browser:
+        self.stop_browser()
+
+  def run_flow(self, bot, rank, bots):
+    """
+    Run the booking flow for one person.  This is the target of each tab's thread.
+    :param bot: The bot that books for the person.
+    :param rank: The person's position in the order in which people should book.
+    :param bots: A list to which to add the bot, once done.
+    """
+    try:
+      start = time.time()
+      bot.rank = rank
+      bot.make_reservations()
+      bot.seconds = time.time() - start # how long this person's flow took, including waiting for a turn
+      bots.append(bot)
+    except Exception as e:
+      self.logger.info('Error booking for {} {}: {}'.format(bot.person.first_name, bot.person.last_name, repr(e)))
+    finally:
+      self.tabs.release()
+
+  def sample_memory(self):
+    """
+    Measure the memory used by the shared browser, per open tab.  Call while holding the lock.
+    :returns: The resident memory of all browser processes divided by the number of open booking tabs, in bytes, or None if unavailable.
+    """
+    rss = self.get_browser_memory()
+    tabs = len(self.driver.window_handles) - 1 # don't count the home tab
+    if rss is None or tabs <= 0:
+      return None
+    return rss / tabs
+
+  def get_browser_memory(self):
+    """
+    Add up the resident memory of chromedriver and all of the chrome processes it has launched.  Only works on Linux.
+    :returns: The total resident memory in bytes, or None if unavailable.
+    """
+    if not os.path.isdir('/proc'):
+      return None
+
+    try:
+      # map each process to its parent and its memory usage
+      parents = {}
+      rss = {}
+      page_size = os.sysconf('SC_PAGE_SIZE')
+      for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+          continue
+        try:
+          with open('/proc/{}/stat'.format(pid)) as f:
+            fields = f.read().rsplit(')', 1)[1].split() # the process name may contain spaces
+          parents[int(pid)] = int(fields[1])
+          rss[int(pid)] = int(fields[21]) * page_size
+        except (IOError, IndexError, ValueError):
+          pass # the process ended while we were looking
+
+      # add up the chromedriver process and all of its descendants
+      total = 0
+      family = [self.driver.service.process.pid]
+      while len(family) > 0:
+        pid = family.pop()
+        total += rss.get(pid, 0)
+        family += [child for child, parent in parents.items() if parent == pid]
+      return total
+    except Exception:
+      return None
+
+  def get_stats(self, bots, seconds):
+    """
+    Summarize memory use and throughput of a run, and log the summary.
+    :param bots: The bots that ran.
+    :param seconds: How long the run took.
+    :returns: A dictionary of statistics.
+    """
+    memory = [m for bot in bots for m in bot.memory if m is not None]
+    flows = sum([len(bot.memory) for bot in bots])
+    bookings = sum([bot.bookings for bot in bots])
+    minutes = max(seconds, 1) / 60
+
+    stats = {
+      'people': len(bots),
+      'flows': flows,
+      'bookings': bookings,
+      'seconds': seconds,
+      'flows_per_minute': flows / minutes,
+      'bookings_per_minute': bookings / minutes,
+      'mean_memory_per_flow_mb': sum(memory) / len(memory) / 2**20 if len(memory) > 0 else None,
+      'max_memory_per_flow_mb': max(memory) / 2**20 if len(memory) > 0 else None
+    }
+
+    self.logger.info('Tabs: {people} people, {flows} flows, {bookings} bookings in {seconds:.1f}s ({flows_per_minute:.1f} flows/min, {bookings_per_minute:.1f} bookings/min)'.format(**stats))
+    if stats['mean_memory_per_flow_mb'] is not None:
+      self.logger.info('Tabs: {mean_memory_per_flow_mb:.0f}MB per flow on average, {max_memory_per_flow_mb:.0f}MB at most'.format(**stats))
+
+    return stats